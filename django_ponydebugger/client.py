@@ -11,6 +11,7 @@ import websocket
 
 from django_ponydebugger.exceptions import *
 from django_ponydebugger.domains.console import ConsolePonyDomain
+from django_ponydebugger.domains.io import IOPonyDomain
 from django_ponydebugger.domains.network import NetworkPonyDomain
 from django_ponydebugger.domains.runtime import RuntimePonyDomain
 
@@ -47,6 +48,7 @@ class PonyClient(threading.Thread):
 
         self._domains = {
             'Console': ConsolePonyDomain(self),
+            'IO': IOPonyDomain(self),
             'Network': NetworkPonyDomain(self),
             'Runtime': RuntimePonyDomain(self),
         }
@@ -69,6 +71,7 @@ class PonyClient(threading.Thread):
         log.info('Connected to Pony server')
         with self._lock:
             self._is_open = True
+        self.get_domain('Console').forget_last_message()
 
         icon_path = os.path.join(os.path.dirname(__file__), 'django-icon.png')
         self.send_notification(
@@ -171,10 +174,8 @@ class PonyClient(threading.Thread):
             func(params)
 
     def log(self, message):
-        self.send_notification(
-            'Console.messageAdded',
-            message={
-                'level': 'log',
-                'source': 'other',
-                'text': message,
-            })
+        self.get_domain('Console').add_message({
+            'level': 'log',
+            'source': 'other',
+            'text': message,
+        })
@@ -1,7 +1,54 @@
+import threading
+
 from django_ponydebugger.domains.base import *
 
 
 class ConsolePonyDomain(BasePonyDomain):
+    def __init__(self, client):
+        super(ConsolePonyDomain, self).__init__(client)
+
+        self._lock = threading.Lock()
+        self._last_message = None
+        self._repeat_count = 0
+
+    @pony_func
+    def enable(self, params):
+        super(ConsolePonyDomain, self).enable(params)
+        self.forget_last_message()
+
+    @pony_func
+    def disable(self, params):
+        super(ConsolePonyDomain, self).disable(params)
+        self.forget_last_message()
+
     @pony_func
     def clearMessages(self, params):
+        self.forget_last_message()
         self.client.get_domain('Runtime').clear()
+
+    def forget_last_message(self):
+        """Make the next message a new one, even if it repeats the last.
+
+        Needed whenever the frontend may not be showing the last message.
+        """
+        with self._lock:
+            self._last_message = None
+
+    def add_message(self, message):
+        """Send a message to the Console.
+
+        A message identical to the previous one only increments the previous
+        message's repeat count.
+        """
+        with self._lock:
+            if message == self._last_message:
+                self._repeat_count += 1
+                self.client.send_notification(
+                    'Console.messageRepeatCountUpdated',
+                    count=self._repeat_count)
+            else:
+                self._last_message = message
+                self._repeat_count = 1
+                self.client.send_notification(
+                    'Console.messageAdded',
+                    message=dict(message, repeatCount=1))
@@ -0,0 +1,87 @@
+import base64
+import codecs
+import collections
+import threading
+
+from django_ponydebugger.domains.base import *
+from django_ponydebugger.exceptions import PonyError
+
+
+class IOPonyDomain(BasePonyDomain):
+    """Incremental reads of data too large to send in a single message.
+
+    Other domains register a file-like object with open_stream() and hand
+    the returned handle to PonyDebugger, which then pulls the data in bounded
+    chunks with IO.read, so no single websocket frame holds all of it.
+    """
+    DEFAULT_READ_SIZE = 64 * 1024
+    MAX_READ_SIZE = 1024 * 1024
+    MAX_STREAMS = 15
+
+    def __init__(self, client):
+        super(IOPonyDomain, self).__init__(client)
+
+        self._lock = threading.Lock()
+        self._next_handle = 0
+        self._streams = collections.OrderedDict()
+
+    def open_stream(self, fileobj, encoding=None):
+        """Register fileobj and return a handle for IO.read.
+
+        If encoding is given, the data is decoded and sent as text; otherwise
+        it is sent base64-encoded.
+        """
+        if encoding is not None:
+            decoder = codecs.getincrementaldecoder(encoding)('replace')
+        else:
+            decoder = None
+
+        with self._lock:
+            handle = str(self._next_handle)
+            self._next_handle += 1
+            self._streams[handle] = (fileobj, decoder)
+            # Forget the oldest streams if PonyDebugger never closed them.
+            while len(self._streams) > self.MAX_STREAMS:
+                _, (old_fileobj, _) = self._streams.popitem(last=False)
+                old_fileobj.close()
+        return handle
+
+    @pony_func
+    def read(self, params):
+        size = params.get('size')
+        if size is None:
+            size = self.DEFAULT_READ_SIZE
+        size = max(1, min(int(size), self.MAX_READ_SIZE))
+        offset = params.get('offset')
+
+        with self._lock:
+            try:
+                fileobj, decoder = self._streams[params['handle']]
+            except KeyError:
+                raise PonyError('Stream not found')
+
+        if offset is not None:
+            fileobj.seek(max(0, int(offset)))
+            if decoder is not None:
+                decoder.reset()
+        data = fileobj.read(size)
+        # The end of the data is only known once a read comes back empty.
+        eof = not data
+        if decoder is not None:
+            return {
+                'data': decoder.decode(data, final=eof),
+                'base64Encoded': False,
+                'eof': eof,
+            }
+        return {
+            'data': base64.b64encode(data),
+            'base64Encoded': True,
+            'eof': eof,
+        }
+
+    @pony_func
+    def close(self, params):
+        with self._lock:
+            stream = self._streams.pop(params['handle'], None)
+        if stream is not None:
+            stream[0].close()
@@ -1,13 +1,19 @@
+import base64
 import collections
 import gzip
+import logging
 import StringIO
+import struct
 import threading
 import time
 
 from django.utils.http import urlencode
 
 from django_ponydebugger.domains.base import *
-from django_ponydebugger.exceptions import PonyError
+from django_ponydebugger.exceptions import PonyError, log_on_exc
+from django_ponydebugger.stats import EndpointStatsCollector
+
+log = logging.getLogger(__name__)
 
 
 class NetworkPonyDomain(BasePonyDomain):
@@ -17,25 +23,120 @@ class NetworkPonyDomain(BasePonyDomain):
         canClearBrowserCookies=False,
     )
 
+    # Limits on the response bodies kept for getResponseBody. Bodies larger
+    # than MAX_BODIES_SIZE on their own are not kept at all.
+    MAX_BODIES = 15
+    MAX_BODIES_SIZE = 10 * 1024 * 1024
+    # Largest decompressed body getResponseBody sends in one message. Larger
+    # text bodies are truncated and larger binary bodies are refused; both
+    # can be read in full with takeResponseBodyAsStream.
+    MAX_INLINE_BODY_SIZE = 4 * 1024 * 1024
+    # Seconds between endpoint statistics summaries sent to the Console.
+    SUMMARY_INTERVAL = 60
+    SUMMARY_MAX_ENDPOINTS = 20
+
     def __init__(self, client):
         super(NetworkPonyDomain, self).__init__(client)
 
         self._lock = threading.Lock()
         self._next_request_id = 0
-        self._bodies = collections.deque(maxlen=15)
+        self._bodies = collections.deque()
+        self._bodies_size = 0
 
-    @pony_func
-    def getResponseBody(self, params):
+        self._stats = EndpointStatsCollector()
+        # Thread ident -> request being handled by that thread. Each live
+        # thread only changes its own entry, and get_in_flight_requests only
+        # removes entries of threads that have exited (and so can't write
+        # them any more), so no lock is needed.
+        self._in_flight = {}
+
+        # Summaries are built and sent from their own thread, so merging
+        # the statistics never delays a request.
+        summary_thread = threading.Thread(target=self._send_summaries)
+        summary_thread.daemon = True
+        summary_thread.start()
+
+    def _get_body(self, request_id):
         with self._lock:
             for req_id, body in self._bodies:
-                if req_id == params['requestId']:
-                    break
-            else:
-                raise PonyError('Request not found')
-        return {'body': body, 'base64Encoded': False}
+                if req_id == request_id:
+                    return body
+        raise PonyError('Request not found')
+
+    @pony_func
+    def getResponseBody(self, params):
+        body = self._get_body(params['requestId'])
+        if body.encoding is None and body.size > self.MAX_INLINE_BODY_SIZE:
+            raise PonyError(
+                'Response body is %d bytes; use '
+                'Network.takeResponseBodyAsStream to read it' % body.size)
+
+        # Don't trust body.size alone: the gzip trailer only holds the size
+        # modulo 2**32.
+        data = body.open().read(self.MAX_INLINE_BODY_SIZE + 1)
+        if body.encoding is None:
+            if len(data) > self.MAX_INLINE_BODY_SIZE:
+                raise PonyError(
+                    'Response body is too large; use '
+                    'Network.takeResponseBodyAsStream to read it')
+            return {'body': base64.b64encode(data), 'base64Encoded': True}
+
+        text = data[:self.MAX_INLINE_BODY_SIZE].decode(
+            body.encoding, 'replace')
+        if len(data) > self.MAX_INLINE_BODY_SIZE:
+            text += (
+                u'\n\n[Truncated by django-ponydebugger: the body is %d '
+                u'bytes; use Network.takeResponseBodyAsStream to read it '
+                u'in full]' % body.size)
+        return {'body': text, 'base64Encoded': False}
+
+    @pony_func
+    def takeResponseBodyAsStream(self, params):
+        """Return an IO stream handle for reading a response body.
+
+        This is an alternative to getResponseBody for clients which support
+        the IO domain, letting them read large bodies in bounded chunks.
+        """
+        body = self._get_body(params['requestId'])
+        handle = self.client.get_domain('IO').open_stream(
+            body.open(), body.encoding)
+        return {'stream': handle}
+
+    @pony_func
+    def getEndpointStats(self, params):
+        """Return request statistics for each resolved URL pattern.
+
+        Latencies are in milliseconds; percentiles are accurate to within
+        about 12%.
+        """
+        endpoints = []
+        for endpoint, stats in sorted(self._stats.snapshot().iteritems()):
+            summary = stats.summary()
+            summary['endpoint'] = endpoint
+            endpoints.append(summary)
+        return {'endpoints': endpoints}
+
+    @pony_func
+    def resetEndpointStats(self, params):
+        self._stats.reset()
+
+    def get_in_flight_requests(self):
+        """Return a dict of thread ident to the request it is handling."""
+        in_flight = dict(self._in_flight)
+        live_idents = set(thread.ident for thread in threading.enumerate())
+        for ident, request in in_flight.items():
+            if ident not in live_idents:
+                # The thread exited without process_response running; don't
+                # let a new thread reusing its ident inherit the request.
+                del in_flight[ident]
+                if self._in_flight.get(ident) is request:
+                    self._in_flight.pop(ident, None)
+        return in_flight
 
     def process_request(self, request):
         """Report the start of each HTTP request to PonyDebugger."""
+        request.pony_start_time = time.time()
+        self._in_flight[threading.current_thread().ident] = request
         if not self.enabled:
             return
 
@@ -93,6 +194,8 @@ class NetworkPonyDomain(BasePonyDomain):
 
     def process_response(self, request, response):
         """Report the end of each HTTP request to PonyDebugger."""
+        self._in_flight.pop(threading.current_thread().ident, None)
+        self._record_stats(request, response)
         if not self.enabled or not hasattr(request, 'pony_state'):
             return response
 
@@ -106,15 +209,8 @@ class NetworkPonyDomain(BasePonyDomain):
                 'X-DjangoPony-User-Email': request.user.email,
             })
 
-        body = response.content
-        if response.get('content-encoding', '') == 'gzip':
-            body = gzip.GzipFile(fileobj=StringIO.StringIO(body)).read()
-        if ('utf-8' in response['content-type'] or
-                response['content-type'].startswith('text/') or
-                'json' in response['content-type']):
-            body = body.decode('utf-8')
-            with self._lock:
-                self._bodies.append((request_id, body))
+        body = _ResponseBody(response)
+        self._store_body(request_id, body)
 
         self.client.send_notification(
             'Network.responseReceived',
@@ -138,8 +234,8 @@ class NetworkPonyDomain(BasePonyDomain):
             'Network.dataReceived',
             requestId=request_id,
             timestamp=time.time(),
-            dataLength=len(response.content),
-            encodedDataLength=len(body),
+            dataLength=body.size,
+            encodedDataLength=len(response.content),
         )
         self.client.send_notification(
             'Network.loadingFinished',
@@ -160,3 +256,100 @@ class NetworkPonyDomain(BasePonyDomain):
         #        #'children': [],
         #    },
         #)
+
+    def _store_body(self, request_id, body):
+        """Keep body for getResponseBody, forgetting the oldest bodies."""
+        body_size = len(body.content)
+        if body_size > self.MAX_BODIES_SIZE:
+            return
+        with self._lock:
+            self._bodies.append((request_id, body))
+            self._bodies_size += body_size
+            while (len(self._bodies) > self.MAX_BODIES or
+                    self._bodies_size > self.MAX_BODIES_SIZE):
+                _, old_body = self._bodies.popleft()
+                self._bodies_size -= len(old_body.content)
+
+    def _record_stats(self, request, response):
+        start_time = getattr(request, 'pony_start_time', None)
+        if start_time is None:
+            return
+        self._stats.record(
+            _endpoint_name(getattr(request, 'resolver_match', None)),
+            time.time() - start_time,
+            response.status_code >= 500)
+
+    @log_on_exc
+    def _send_summaries(self):
+        """Thread body which logs endpoint statistics to the Console."""
+        while True:
+            time.sleep(self.SUMMARY_INTERVAL)
+            if not self.client.get_domain('Console').enabled:
+                continue
+            try:
+                summary = self._format_summary()
+                if summary is not None:
+                    self.client.log(summary)
+            except Exception:
+                log.error('Error sending endpoint summary', exc_info=True)
+
+    def _format_summary(self):
+        """Return the summary table, or None if nothing was recorded."""
+        stats = sorted(
+            self._stats.snapshot().iteritems(),
+            key=lambda item: item[1].latency.percentile(99),
+            reverse=True)
+        if not stats:
+            return None
+        lines = ['Slowest endpoints by p99 latency (ms):']
+        lines.append('%8s %6s %8s %8s %8s  %s' % (
+            'count', 'err%', 'p50', 'p99', 'max', 'endpoint'))
+        for endpoint, endpoint_stats in stats[:self.SUMMARY_MAX_ENDPOINTS]:
+            summary = endpoint_stats.summary()
+            lines.append('%8d %6.1f %8.1f %8.1f %8.1f  %s' % (
+                summary['count'], summary['errorRate'] * 100,
+                summary['p50'], summary['p99'], summary['max'], endpoint))
+        return '\n'.join(lines)
+
+
+def _endpoint_name(resolver_match):
+    """Return the URL pattern (or view name) a request was resolved to."""
+    if resolver_match is None:
+        return '<unresolved>'
+    # ResolverMatch.route was added in Django 2.2.
+    return (getattr(resolver_match, 'route', None) or
+            resolver_match.view_name or
+            '<unnamed view>')
+
+
+class _ResponseBody(object):
+    """A response body as it was sent, decompressed only when read.
+
+    This keeps a reference to the response content rather than a decoded
+    copy, so binary and compressed bodies cost no extra memory until
+    PonyDebugger asks for them.
+    """
+
+    def __init__(self, response):
+        self.content = response.content
+        self.gzipped = response.get('content-encoding', '') == 'gzip'
+
+        content_type = response['content-type']
+        if ('utf-8' in content_type or content_type.startswith('text/') or
+                'json' in content_type):
+            self.encoding = 'utf-8'
+        else:
+            self.encoding = None
+
+        # The gzip trailer records the uncompressed size (modulo 2**32).
+        if self.gzipped and len(self.content) >= 4:
+            self.size = struct.unpack('<I', self.content[-4:])[0]
+        else:
+            self.size = len(self.content)
+
+    def open(self):
+        """Return a file-like object yielding the uncompressed body."""
+        fileobj = StringIO.StringIO(self.content)
+        if self.gzipped:
+            fileobj = gzip.GzipFile(fileobj=fileobj)
+        return fileobj
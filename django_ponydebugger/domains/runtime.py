@@ -1,26 +1,45 @@
 import ast
+import bisect
 import code
 import codeop
 import collections
 import json
 import logging
+import threading
+import time
+import types
+import weakref
 
 from django_ponydebugger.domains.base import *
 from django_ponydebugger.exceptions import PonyError
+from django_ponydebugger.threads import describe_frame, sample_stacks
 
 log = logging.getLogger(__name__)
 
 
 class RuntimePonyDomain(BasePonyDomain):
+    # Limits for getThreadStacks, which blocks the websocket while sampling.
+    MAX_STACK_SAMPLES = 10
+    MAX_STACK_INTERVAL = 1.0
+
     def __init__(self, client):
         super(RuntimePonyDomain, self).__init__(client)
 
         self._locals = {}
         self._consoles = collections.defaultdict(
-            lambda: PonyConsole(self.client.log, self._locals))
+            lambda: PonyConsole(
+                self.client.log, self._locals,
+                on_run=self._invalidate_completions))
         self._remote_objects = {}
         self._remote_objects_by_group = {}
 
+        # Completion indexes are sorted tuples of names, so that prefix
+        # lookups can bisect instead of scanning. The locals index is rebuilt
+        # whenever a console runs code; the per-type indexes are keyed by
+        # class and hold weak references so classes can still be collected.
+        self._locals_completions = None
+        self._type_completions = weakref.WeakKeyDictionary()
+
         # Pre-populate some entries in locals
         self._consoles[''].pony('')
 
@@ -147,6 +166,58 @@ class RuntimePonyDomain(BasePonyDomain):
                 'wasThrown': False,
             }
 
+    @pony_func
+    def getThreadStacks(self, params):
+        """Return the stack of every thread and the request it's handling.
+
+        The stacks are captured `samples` times, `interval` seconds apart.
+        Threads handling a request whose stack didn't change (blocked, or
+        spinning on one line) are marked as stuck; idle threads aren't. If
+        `log` is true, the stacks are also written to the Console in
+        traceback form.
+        """
+        samples = max(1, min(
+            int(params.get('samples', 3)), self.MAX_STACK_SAMPLES))
+        interval = max(0, min(
+            float(params.get('interval', 0.1)), self.MAX_STACK_INTERVAL))
+
+        stacks, unchanged = sample_stacks(samples, interval)
+        requests = self.client.get_domain('Network').get_in_flight_requests()
+        stuck = unchanged.intersection(requests)
+        threads_by_ident = dict(
+            (thread.ident, thread) for thread in threading.enumerate())
+        now = time.time()
+
+        threads = []
+        for ident, stack in stacks.iteritems():
+            thread = threads_by_ident.get(ident)
+            request = requests.get(ident)
+            if request is not None:
+                request_info = {
+                    'requestId': getattr(
+                        request, 'pony_state', {}).get('id'),
+                    'method': request.method,
+                    'url': request.get_full_path(),
+                    'duration': now - request.pony_start_time,
+                }
+            else:
+                request_info = None
+            threads.append({
+                'ident': ident,
+                'name': thread.name if thread is not None else None,
+                'daemon': thread.daemon if thread is not None else None,
+                'stuck': ident in stuck,
+                'request': request_info,
+                'stack': [describe_frame(frame) for frame in stack],
+            })
+        threads.sort(key=lambda info: (
+            not info['stuck'],
+            -info['request']['duration'] if info['request'] else 0))
+
+        if params.get('log', False):
+            self.client.log(_format_thread_stacks(threads))
+        return {'threads': threads}
+
     def _make_remote_object(self, value, by_value, obj_group):
         primitive_types = [
             (type(None), 'undefined'),
@@ -184,6 +255,11 @@ class RuntimePonyDomain(BasePonyDomain):
         return result
 
     def _get_completions(self, obj, args):
+        """Return {name: True} for each completion of obj.
+
+        args is [type] or [type, prefix], where type is the JS type of the
+        expression being completed and prefix limits the returned names.
+        """
         if args:
             if args[0] == 'string':
                 obj = ''
@@ -191,18 +267,108 @@ class RuntimePonyDomain(BasePonyDomain):
                 obj = 0
             elif args[0] == 'boolean':
                 obj = False
-        result = {}
+        prefix = args[1] if len(args) > 1 and args[1] else ''
+
         if obj is self._locals:
-            for name in obj:
-                result[name] = True
-            for name in obj['__builtins__']:
-                result[name] = True
+            if self._locals_completions is None:
+                self._locals_completions = self._build_locals_completions()
+            names = _filter_prefix(self._locals_completions, prefix)
+        elif _has_custom_dir(obj):
+            # A custom __dir__ may list anything, so it can't be cached.
+            names = _filter_prefix(sorted(
+                name for name in dir(obj) if not _is_dunder(name)), prefix)
         else:
-            for name in dir(obj):
-                if name.startswith('__') and name.endswith('__'):
-                    continue
-                result[name] = True
-        return result
+            names = _filter_prefix(self._get_type_completions(obj), prefix)
+            # Instance attributes aren't covered by the per-type index.
+            # Modules also keep their contents here.
+            instance_dict = getattr(obj, '__dict__', None)
+            if isinstance(instance_dict, dict):
+                names.extend(
+                    name for name in instance_dict
+                    if isinstance(name, basestring) and
+                    name.startswith(prefix) and not _is_dunder(name))
+        return dict.fromkeys(names, True)
+
+    def _build_locals_completions(self):
+        builtins = self._locals.get('__builtins__', {})
+        if isinstance(builtins, types.ModuleType):
+            builtins = vars(builtins)
+        names = set(self._locals)
+        names.update(builtins)
+        return tuple(sorted(names))
+
+    def _get_type_completions(self, obj):
+        # Classes complete to their own attributes, which is exactly what
+        # their instances get from them, so both share one index entry.
+        cls = _completion_class(obj)
+        names = self._type_completions.get(cls)
+        if names is None:
+            names = tuple(sorted(
+                name for name in dir(cls) if not _is_dunder(name)))
+            self._type_completions[cls] = names
+        return names
+
+    def _invalidate_completions(self):
+        """Drop cached completions after a console has run code.
+
+        Code run from the console can rebind locals as well as add
+        attributes to classes, so both indexes are discarded.
+        """
+        self._locals_completions = None
+        self._type_completions.clear()
+
+
+def _format_thread_stacks(threads):
+    lines = []
+    for info in threads:
+        header = 'Thread %s (%s)' % (info['name'], info['ident'])
+        if info['stuck']:
+            header += ' [stuck]'
+        request = info['request']
+        if request is not None:
+            header += ': %s %s for %.1fs' % (
+                request['method'], request['url'], request['duration'])
+        lines.append(header)
+        for frame in reversed(info['stack']):
+            lines.append('  File "%s", line %d, in %s' % (
+                frame['url'], frame['lineNumber'], frame['functionName']))
+            if frame['line']:
+                lines.append('    ' + frame['line'])
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def _completion_class(obj):
+    """Return the class whose attributes obj's completions come from."""
+    if isinstance(obj, (type, types.ClassType)):
+        return obj
+    # type() of an old-style instance is InstanceType, not its class.
+    return getattr(obj, '__class__', type(obj))
+
+
+def _has_custom_dir(obj):
+    # Neither object nor old-style classes define __dir__, and dir() on a
+    # class doesn't use the __dir__ its instances get.
+    if isinstance(obj, (type, types.ClassType)):
+        return False
+    return hasattr(_completion_class(obj), '__dir__')
+
+
+def _is_dunder(name):
+    return name.startswith('__') and name.endswith('__')
+
+
+def _filter_prefix(sorted_names, prefix):
+    """Return a list of the names in sorted_names which start with prefix."""
+    if not prefix:
+        return list(sorted_names)
+    index = bisect.bisect_left(sorted_names, prefix)
+    result = []
+    while (index < len(sorted_names) and
+            sorted_names[index].startswith(prefix)):
+        result.append(sorted_names[index])
+        index += 1
+    return result
 
 
 class PonyConsole(code.InteractiveConsole):
@@ -221,7 +387,7 @@ class PonyConsole(code.InteractiveConsole):
     output to PonyDebugger.
     """
 
-    def __init__(self, log, local):
+    def __init__(self, log, local, on_run=None):
         if not local:
             local.update({
                 '__name__': '__console__',
@@ -230,6 +396,7 @@ class PonyConsole(code.InteractiveConsole):
         code.InteractiveConsole.__init__(self, local)
         self.compile.compiler = PonyConsole.PonyCompiler()
         self.log = log
+        self.on_run = on_run
         self.partial_count = 0
 
     def _pony_result(self, result):
@@ -241,6 +408,13 @@ class PonyConsole(code.InteractiveConsole):
     def write(self, data):
         self.errors.append(data)
 
+    def runcode(self, code_obj):
+        try:
+            code.InteractiveConsole.runcode(self, code_obj)
+        finally:
+            if self.on_run is not None:
+                self.on_run()
+
     def pony(self, src):
         """Run a single line of Python code."""
         self.errors = []
@@ -0,0 +1,192 @@
+import logging
+import Queue
+import sys
+import threading
+import time
+import traceback
+
+from django_ponydebugger import client
+from django_ponydebugger.exceptions import log_on_exc
+
+log = logging.getLogger(__name__)
+
+
+class PonyHandler(logging.Handler):
+    """Logging handler which sends records to the PonyDebugger Console.
+
+    Add it to the LOGGING setting like any other handler:
+
+        'handlers': {
+            'pony': {
+                'level': 'INFO',
+                'class': 'django_ponydebugger.handlers.PonyHandler',
+            },
+        },
+
+    emit() only queues the record; a background thread sends it, so logging
+    never waits on the websocket. Each logger may send at most `rate`
+    records per second (with bursts of up to `burst`), and records beyond
+    that or beyond `queue_size` pending records are dropped and counted.
+    Records at or above `stack_level` have a separate allowance, so a storm
+    of debug messages can't crowd out errors from the same logger.
+    Consecutive identical messages are shown once with a repeat count.
+
+    Records at or above `stack_level` without exception info include the
+    stack of the logging call.
+    """
+    # Sending a message logs through these, which would loop back here.
+    IGNORED_LOGGERS = ('django_ponydebugger', 'websocket')
+
+    LEVELS = [
+        (logging.ERROR, 'error'),
+        (logging.WARNING, 'warning'),
+        (logging.INFO, 'log'),
+        (logging.NOTSET, 'debug'),
+    ]
+
+    def __init__(self, level=logging.NOTSET, rate=10, burst=50,
+                 queue_size=1000, stack_level=logging.ERROR):
+        logging.Handler.__init__(self, level)
+        self.rate = rate
+        self.burst = burst
+        self.stack_level = stack_level
+
+        self._queue = Queue.Queue(queue_size)
+        self._thread = None
+        # (logger name, severe) -> [tokens, last refill, suppressed count]
+        self._buckets = {}
+        self._dropped = 0
+
+    def emit(self, record):
+        # Handler.handle() holds self.lock, so the rate limiting state below
+        # needs no further locking.
+        if record.name.startswith(self.IGNORED_LOGGERS):
+            return
+        if threading.current_thread() is self._thread:
+            return
+
+        suppressed = self._take_token(
+            (record.name, record.levelno >= self.stack_level))
+        if suppressed is None:
+            return
+
+        try:
+            message = self._make_message(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        if suppressed:
+            self._put({
+                'level': 'warning',
+                'source': 'other',
+                'text': 'Suppressed %d message(s) from logger %r' % (
+                    suppressed, record.name),
+            })
+        self._put(message)
+
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _take_token(self, key):
+        """Apply the rate limit for the given bucket.
+
+        Returns None if the record should be dropped, or else the number of
+        records from this bucket that were dropped since the last one sent.
+        """
+        now = time.time()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now, 0]
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            bucket[2] += 1
+            return None
+        bucket[0] -= 1
+        suppressed, bucket[2] = bucket[2], 0
+        return suppressed
+
+    def _put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except Queue.Full:
+            self._dropped += 1
+
+    def _make_message(self, record):
+        for levelno, level in self.LEVELS:
+            if record.levelno >= levelno:
+                break
+
+        if record.exc_info:
+            frames = [
+                (filename, lineno, name)
+                for filename, lineno, name, line in
+                traceback.extract_tb(record.exc_info[2])
+            ]
+            frames.reverse()
+        elif record.levelno >= self.stack_level:
+            frames = _call_stack(record)
+        else:
+            frames = []
+
+        return {
+            'level': level,
+            'source': 'other',
+            'text': self.format(record),
+            'url': record.pathname,
+            'line': record.lineno,
+            'stackTrace': [
+                {
+                    'functionName': name,
+                    'url': filename,
+                    'lineNumber': lineno,
+                    'columnNumber': 0,
+                }
+                for filename, lineno, name in frames
+            ],
+        }
+
+    @log_on_exc
+    def _run(self):
+        """Thread body which sends queued messages to PonyDebugger."""
+        console = client.PonyClient.get().get_domain('Console')
+        while True:
+            message = self._queue.get()
+            if not console.enabled:
+                continue
+            # A failed send (e.g. on a socket that is closing) must not
+            # stop this thread, or every later record would be lost.
+            try:
+                if self._dropped:
+                    # Reading and resetting this isn't atomic, so a drop may
+                    # occasionally go unreported; it's only a diagnostic.
+                    dropped, self._dropped = self._dropped, 0
+                    console.add_message({
+                        'level': 'warning',
+                        'source': 'other',
+                        'text': 'Dropped %d message(s); the queue was full' %
+                                (dropped,),
+                    })
+                console.add_message(message)
+            except Exception:
+                log.error('Error sending log record to Pony', exc_info=True)
+
+
+def _call_stack(record):
+    """Return (filename, lineno, name) for the frames leading to record.
+
+    Logging internals are skipped by looking for the frame which made the
+    logging call. Returns an empty list if it can't be found.
+    """
+    frames = []
+    frame = sys._getframe()
+    while frame is not None:
+        code = frame.f_code
+        if frames or (code.co_filename == record.pathname and
+                      frame.f_lineno == record.lineno):
+            frames.append((code.co_filename, frame.f_lineno, code.co_name))
+        frame = frame.f_back
+    return frames
@@ -0,0 +1,167 @@
+import threading
+
+
+class LatencyHistogram(object):
+    """Fixed-size histogram of latencies with log-scaled buckets.
+
+    Values are recorded in microseconds. As in HdrHistogram, each power of
+    two is split into SUB_BUCKETS linear sub-buckets, so every value is
+    stored with a relative error of at most 1/SUB_BUCKETS regardless of its
+    magnitude, and memory use doesn't depend on the number of values.
+    """
+    SUB_BUCKET_BITS = 3
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+    # Enough buckets for values up to 2**37 microseconds (about 38 hours).
+    NUM_BUCKETS = (37 - SUB_BUCKET_BITS + 1) * SUB_BUCKETS
+
+    def __init__(self):
+        self.counts = [0] * self.NUM_BUCKETS
+        self.total = 0
+        self.max = 0
+
+    @classmethod
+    def _bucket_index(cls, value):
+        if value < cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - 1 - cls.SUB_BUCKET_BITS
+        index = (shift + 1) * cls.SUB_BUCKETS + (
+            (value >> shift) - cls.SUB_BUCKETS)
+        return min(index, cls.NUM_BUCKETS - 1)
+
+    @classmethod
+    def _bucket_upper_bound(cls, index):
+        if index < cls.SUB_BUCKETS:
+            return index
+        shift = index // cls.SUB_BUCKETS - 1
+        mantissa = index % cls.SUB_BUCKETS + cls.SUB_BUCKETS
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value):
+        value = max(int(value), 0)
+        self.counts[self._bucket_index(value)] += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            if count:
+                self.counts[i] += count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        """Return an upper bound for the given percentile of the values."""
+        threshold = sum(self.counts) * percent / 100.0
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= threshold:
+                return min(self._bucket_upper_bound(i), self.max)
+        return 0
+
+
+class EndpointStats(object):
+    """Request count, error count and latencies for a single endpoint."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.latency = LatencyHistogram()
+
+    def record(self, duration, is_error):
+        self.count += 1
+        if is_error:
+            self.errors += 1
+        self.latency.record(duration * 1e6)
+
+    def merge(self, other):
+        self.count += other.count
+        self.errors += other.errors
+        self.latency.merge(other.latency)
+
+    def summary(self):
+        """Return a JSON-serializable summary, with latencies in ms."""
+        latency = self.latency
+        return {
+            'count': self.count,
+            'errorCount': self.errors,
+            'errorRate': float(self.errors) / self.count if self.count else 0,
+            'mean': latency.total / 1e3 / self.count if self.count else 0,
+            'p50': latency.percentile(50) / 1e3,
+            'p90': latency.percentile(90) / 1e3,
+            'p99': latency.percentile(99) / 1e3,
+            'max': latency.max / 1e3,
+        }
+
+
+class EndpointStatsCollector(object):
+    """Per-endpoint statistics, aggregated without a shared lock.
+
+    Each thread records into its own shard (a dict of endpoint to
+    EndpointStats), which only that thread ever writes to. Readers merge all
+    of the shards; shards of threads which have exited are folded into a
+    single retired shard at that point so that servers which start a thread
+    per request don't accumulate shards.
+
+    reset() doesn't touch existing shards; it bumps a generation counter,
+    and each thread starts a new shard when it sees that its own is from an
+    older generation. A record made while reset() runs may be lost.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards_lock = threading.Lock()
+        self._shards = []
+        self._retired = {}
+        self._generation = 0
+
+    def _get_shard(self):
+        generation = self._generation
+        if getattr(self._local, 'generation', None) != generation:
+            self._local.shard = {}
+            self._local.generation = generation
+            with self._shards_lock:
+                if self._generation == generation:
+                    self._shards.append(
+                        (threading.current_thread(), self._local.shard))
+        return self._local.shard
+
+    def record(self, endpoint, duration, is_error):
+        shard = self._get_shard()
+        stats = shard.get(endpoint)
+        if stats is None:
+            stats = shard[endpoint] = EndpointStats()
+        stats.record(duration, is_error)
+
+    def snapshot(self):
+        """Return a dict of endpoint to merged EndpointStats."""
+        with self._shards_lock:
+            live_shards = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live_shards.append((thread, shard))
+                else:
+                    _merge_shard(self._retired, shard)
+            self._shards = live_shards
+
+            merged = {}
+            _merge_shard(merged, self._retired)
+            for thread, shard in live_shards:
+                _merge_shard(merged, shard)
+        return merged
+
+    def reset(self):
+        with self._shards_lock:
+            self._generation += 1
+            self._shards = []
+            self._retired = {}
+
+
+def _merge_shard(dest, shard):
+    # items() copies the dict atomically, so the owning thread may keep
+    # adding endpoints while this runs.
+    for endpoint, stats in shard.items():
+        if endpoint not in dest:
+            dest[endpoint] = EndpointStats()
+        dest[endpoint].merge(stats)
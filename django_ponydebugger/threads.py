@@ -0,0 +1,57 @@
+import linecache
+import sys
+import threading
+import time
+
+
+def capture_stacks():
+    """Return the current stack of every thread other than this one.
+
+    The result maps each thread's ident to a tuple of (filename, lineno,
+    function name) frames, innermost first. Source lines aren't looked up,
+    so this is cheap enough to call repeatedly in a busy process.
+    """
+    current = threading.current_thread().ident
+    stacks = {}
+    for ident, frame in sys._current_frames().items():
+        if ident == current:
+            continue
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, frame.f_lineno, code.co_name))
+            frame = frame.f_back
+        stacks[ident] = tuple(stack)
+    return stacks
+
+
+def sample_stacks(samples, interval):
+    """Capture stacks `samples` times, `interval` seconds apart.
+
+    Returns (stacks, unchanged): the stacks from the last capture, and the
+    set of idents of threads whose stack was the same in every capture. A
+    thread blocked on a lock, a socket read or a database call stays on one
+    frame, but so does an idle thread waiting for work.
+    """
+    stacks = capture_stacks()
+    unchanged = set(ident for ident, stack in stacks.items() if stack)
+    for i in range(samples - 1):
+        time.sleep(interval)
+        previous, stacks = stacks, capture_stacks()
+        unchanged = set(
+            ident for ident in unchanged
+            if stacks.get(ident) == previous[ident])
+    if samples < 2:
+        unchanged = set()
+    return stacks, unchanged
+
+
+def describe_frame(frame):
+    """Return a JSON-serializable dict describing a captured frame."""
+    filename, lineno, name = frame
+    return {
+        'functionName': name,
+        'url': filename,
+        'lineNumber': lineno,
+        'line': linecache.getline(filename, lineno).strip(),
+    }